@@ -29,4 +29,10 @@ would need. Maintain the original formatting for code blocks.
 Content:
 """
 
-
+def get_batch_prompt() -> str:
+    """Get the instructions for summarizing several sections in one request."""
+    return """The content below contains several independent markdown sections, each introduced 
+by a line of the form "=== SECTION n ===". Summarize every section separately using the guidelines 
+above and return one summary per section, in the same order. Do not include the "=== SECTION n ===" 
+marker lines in the summaries.
+"""
@@ -1,53 +1,186 @@
-from typing import Optional
+import asyncio
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
 from pydantic_ai import Agent
 from pydantic_ai.usage import Usage
 from pydantic import BaseModel
-from ..agent.prompts import get_summarization_prompt, get_system_prompt
+from ..agent.prompts import get_batch_prompt, get_summarization_prompt, get_system_prompt
 from ..config.settings import get_settings
 import tiktoken
 
+@lru_cache(maxsize=None)
+def _get_encoding(model: str) -> tiktoken.Encoding:
+    """Get the tiktoken encoding for a model, loading it only once."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Models tiktoken doesn't know (e.g. other providers) get a close approximation
+        return tiktoken.get_encoding("cl100k_base")
+
+@lru_cache(maxsize=32)
+def _count_prompt_tokens(prompt: str, model: str) -> int:
+    """Count tokens in a prompt, caching the result since prompts rarely change."""
+    return len(_get_encoding(model).encode(prompt))
+
 class SummarizeResult(BaseModel):
     """Result of summarization."""
     content: str
 
+class SummarizeBatchResult(BaseModel):
+    """Result of summarizing several sections in one request."""
+    contents: List[str]
+
+def _section_marker(n: int) -> str:
+    """Get the line that introduces the nth section of a batch request."""
+    return f"=== SECTION {n} ==="
+
+@dataclass
+class _InFlightRequest:
+    """A model request shared by every caller summarizing the same content."""
+    task: asyncio.Task
+    waiters: int = 0
+
 class SummarizerAgent:
     """Agent for summarizing text content using AI."""
     
-    def __init__(self, system_prompt: Optional[str] = None, user_prompt: Optional[str] = None):
+    def __init__(
+        self,
+        system_prompt: Optional[str] = None,
+        user_prompt: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        cache_dir: Optional[str] = None
+    ):
         """Initialize with API key and model."""
         self.usage = Usage()  # Track cumulative token usage
         self.settings = get_settings()
         
+        # Cap in-flight requests so large documents don't burst past provider rate limits
+        if max_concurrency is None:
+            max_concurrency = self.settings.max_concurrency
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        
+        # Minimum spacing between request starts when a requests-per-minute limit is set
+        rpm = self.settings.max_requests_per_minute
+        self._request_interval = 60.0 / rpm if rpm > 0 else 0.0
+        self._next_request_at = 0.0
+        
+        # Summaries keyed by content hash so repeated sections are only sent once,
+        # including duplicates that arrive while the first request is in flight
+        self._cache: Dict[bytes, str] = {}
+        self._in_flight: Dict[bytes, _InFlightRequest] = {}
+        
+        # Optionally persist summaries so re-runs over unchanged sections skip the API
+        if cache_dir is None:
+            cache_dir = self.settings.cache_dir
+        self._cache_dir = Path(cache_dir) if cache_dir else None
+        if self._cache_dir:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+        
         # Store prompts
         self._system_prompt = system_prompt or get_system_prompt()
         self._user_prompt = user_prompt or get_summarization_prompt()
+        self._prompt_prefix = f"{self._user_prompt}\n\n"
         
-        # these will not be precise since a different model could be used
-        # but should be good enough for our purposes
-        self.system_prompt_tokens = self._count_tokens_openai(self._system_prompt)
-        self.document_prompt_tokens = self._count_tokens_openai(self._user_prompt)
+        # Count with the configured model's encoding, without any "provider:" prefix.
+        # Non-OpenAI models fall back to cl100k_base, which is close enough for our purposes
+        self._token_model = self.settings.model.split(':')[-1]
+        self.system_prompt_tokens = _count_prompt_tokens(self._system_prompt, self._token_model)
+        self.document_prompt_tokens = _count_prompt_tokens(self._user_prompt, self._token_model)
+        
+        # Extra prompt tokens of a batch request: the instructions once, plus a marker per section
+        self.batch_prompt_tokens = _count_prompt_tokens(get_batch_prompt(), self._token_model)
+        self.section_marker_tokens = _count_prompt_tokens(
+            f"\n\n{_section_marker(999)}\n", self._token_model
+        )
         
         # Initialize AI agent
+        self._build_agents()
+
+    def _build_agents(self) -> None:
+        """Create the single-section and batch agents for the current system prompt."""
         self.agent = Agent(
-            get_settings().model,
+            self.settings.model,
             result_type=SummarizeResult,
             system_prompt=self._system_prompt,
         )
+        self.batch_agent = Agent(
+            self.settings.model,
+            result_type=SummarizeBatchResult,
+            system_prompt=self._system_prompt,
+        )
+
+    def estimate_tokens(self, text: str) -> int:
+        """Cheaply bound the tokens in text from above without tokenizing it.
+        
+        Every BPE token covers at least one byte, so the UTF-8 length is a true
+        upper bound, including for text without spaces such as CJK or URLs. It
+        overestimates English by about 4x, so use it only to rule out overflow.
+        """
+        return len(text.encode('utf-8'))
+
+    def _cache_key(self, content: str) -> bytes:
+        """Hash content together with everything else that shapes its summary."""
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (self.settings.model, self._system_prompt, self._user_prompt, content):
+            digest.update(part.encode())
+            digest.update(b'\0')
+        return digest.digest()
+
+    def _get_cached(self, key: bytes) -> Optional[str]:
+        """Look up a summary in memory, then in the on-disk cache if enabled."""
+        summary = self._cache.get(key)
+        if summary is None and self._cache_dir:
+            path = self._cache_dir / f"{key.hex()}.md"
+            if path.is_file():
+                summary = self._cache[key] = path.read_text(encoding="utf-8")
+        return summary
+
+    def _set_cached(self, key: bytes, summary: str) -> None:
+        """Store a summary in memory and in the on-disk cache if enabled."""
+        self._cache[key] = summary
+        if not self._cache_dir:
+            return
+        # Write to a temporary file and rename it into place, so an interrupted
+        # write or a concurrent reader never sees a truncated summary
+        fd, tmp_path = tempfile.mkstemp(dir=self._cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                file.write(summary)
+            os.replace(tmp_path, self._cache_dir / f"{key.hex()}.md")
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    async def acount_tokens(self, text: str) -> int:
+        """Count tokens in text without blocking the event loop."""
+        return await asyncio.to_thread(self._count_tokens_openai, text)
 
-    def _count_tokens_openai(self, text: str, model: str = "gpt-3.5-turbo") -> int:
+    def _count_tokens_openai(self, text: str, model: Optional[str] = None) -> int:
         """Count tokens for OpenAI models using tiktoken. 
         Args:
             text: Text to count tokens for
-            model: Model name to use encoding for, defaults to gpt-3.5-turbo
+            model: Model name to use encoding for, defaults to the configured model
             
         Returns:
             Number of tokens in text
         """
-        encoding = tiktoken.encoding_for_model(model)
-        return len(encoding.encode(text))
+        return len(_get_encoding(model or self._token_model).encode(text))
 
-    def update_usage(self, result) -> None:
-        """Update usage statistics."""
+    def update_usage(self, result, overhead_tokens: int = 0) -> None:
+        """Update usage statistics.
+        
+        Args:
+            result: Result of the agent run
+            overhead_tokens: Prompt tokens other than the system and document
+                prompts that don't belong to the sections, e.g. batch markers
+        """
         usage_data = Usage(
             # Count this as one API request
             requests=1,
@@ -56,7 +189,12 @@ class SummarizerAgent:
             # we need to subtract the system and document prompt tokens.  
             #   - this is because our goal is to measure only the tokens from the section
             #     being summarized
-            request_tokens=result.usage().request_tokens - self.system_prompt_tokens - self.document_prompt_tokens,
+            request_tokens=(
+                result.usage().request_tokens
+                - self.system_prompt_tokens
+                - self.document_prompt_tokens
+                - overhead_tokens
+            ),
             
             # Output tokens generated in the response
             response_tokens=result.usage().response_tokens,
@@ -77,12 +215,8 @@ class SummarizerAgent:
     def system_prompt(self, prompt: str):
         """Set a custom system prompt."""
         self._system_prompt = prompt
-        self.system_prompt_tokens = self._count_tokens_openai(prompt)
-        self.agent = Agent(
-            get_settings().model,
-            result_type=SummarizeResult,
-            system_prompt=prompt,
-        )
+        self.system_prompt_tokens = _count_prompt_tokens(prompt, self._token_model)
+        self._build_agents()
     
     @property
     def user_prompt(self) -> str:
@@ -93,18 +227,116 @@ class SummarizerAgent:
     def user_prompt(self, prompt: str):
         """Set a custom user prompt template."""
         self._user_prompt = prompt
-        self.document_prompt_tokens = self._count_tokens_openai(prompt)
+        self._prompt_prefix = f"{prompt}\n\n"
+        self.document_prompt_tokens = _count_prompt_tokens(prompt, self._token_model)
+
+    async def _throttle(self) -> None:
+        """Wait for the next request slot allowed by max_requests_per_minute."""
+        if not self._request_interval:
+            return
+        now = asyncio.get_running_loop().time()
+        # Reserve the slot before sleeping so concurrent callers queue up behind it
+        start = max(now, self._next_request_at)
+        self._next_request_at = start + self._request_interval
+        if start > now:
+            await asyncio.sleep(start - now)
 
     async def run(self, content: str) -> str:
         """Run the agent and update usage statistics."""
         if not content.strip():
             return content
             
+        key = self._cache_key(content)
+        cached = self._get_cached(key)
+        if cached is not None:
+            return cached
+        
+        request = self._in_flight.get(key)
+        if request is None:
+            request = _InFlightRequest(asyncio.create_task(self._summarize(key, content)))
+            self._in_flight[key] = request
+            request.task.add_done_callback(lambda task: self._request_done(key, task))
+        
+        request.waiters += 1
+        try:
+            # Shield so a cancelled caller doesn't cancel the request for other callers
+            return await asyncio.shield(request.task)
+        finally:
+            request.waiters -= 1
+            # Nobody is left waiting (e.g. stream() was cancelled), so stop the request
+            # instead of letting it use up quota in the background. Forget it right away
+            # so a new caller starts a fresh request rather than joining the dying one
+            if not request.waiters and not request.task.done():
+                request.task.cancel()
+                if self._in_flight.get(key) is request:
+                    del self._in_flight[key]
+
+    def _request_done(self, key: bytes, task: asyncio.Task) -> None:
+        """Forget a finished request and retrieve its exception so it isn't reported as unhandled."""
+        self._in_flight.pop(key, None)
+        if not task.cancelled():
+            task.exception()
+
+    async def _summarize(self, key: bytes, content: str) -> str:
+        """Request a summary from the model and cache it."""
         # Use the custom user prompt
-        user_prompt = self._user_prompt + "\n\n" + content
+        user_prompt = self._prompt_prefix + content
         
-        result = await self.agent.run(user_prompt=user_prompt)
+        async with self._semaphore:
+            await self._throttle()
+            result = await self.agent.run(user_prompt=user_prompt)
         
         self.update_usage(result)
-        return result.data.content 
-       
\ No newline at end of file
+        self._set_cached(key, result.data.content)
+        return result.data.content
+
+    async def run_batch(self, contents: List[str]) -> List[str]:
+        """Summarize several sections in a single request.
+        
+        Falls back to one request per section if the model does not return
+        exactly one summary per section.
+        """
+        results = list(contents)
+        # Indexes of the uncached contents, grouped so duplicates are only sent once
+        groups: Dict[bytes, List[int]] = {}
+        for i, content in enumerate(contents):
+            if not content.strip():
+                continue
+            key = self._cache_key(content)
+            cached = self._get_cached(key)
+            if cached is not None:
+                results[i] = cached
+            else:
+                groups.setdefault(key, []).append(i)
+        
+        firsts = [indexes[0] for indexes in groups.values()]
+        if len(firsts) < 2:
+            for indexes in groups.values():
+                summary = await self.run(contents[indexes[0]])
+                for i in indexes:
+                    results[i] = summary
+            return results
+        
+        sections = '\n\n'.join(
+            f"{_section_marker(n)}\n{contents[i]}"
+            for n, i in enumerate(firsts, start=1)
+        )
+        user_prompt = f"{self._prompt_prefix}{get_batch_prompt()}\n{sections}"
+        
+        async with self._semaphore:
+            await self._throttle()
+            result = await self.batch_agent.run(user_prompt=user_prompt)
+        
+        self.update_usage(
+            result,
+            self.batch_prompt_tokens + self.section_marker_tokens * len(firsts)
+        )
+        summaries = result.data.contents
+        if len(summaries) != len(firsts):
+            summaries = await asyncio.gather(*(self.run(contents[i]) for i in firsts))
+        
+        for (key, indexes), summary in zip(groups.items(), summaries):
+            self._set_cached(key, summary)
+            for i in indexes:
+                results[i] = summary
+        return results
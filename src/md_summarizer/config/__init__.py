@@ -1,4 +1,4 @@
 """Configuration module."""
-from .settings import get_settings, Settings
+from .settings import get_settings, reload_settings, Settings
 
-__all__ = ['get_settings', 'Settings'] 
\ No newline at end of file
+__all__ = ['get_settings', 'reload_settings', 'Settings'] 
\ No newline at end of file
@@ -1,9 +1,13 @@
 import os
 from functools import lru_cache
 from typing import Optional
+from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from dotenv import load_dotenv
 
+# .env files are only loaded once per process, see reload_settings()
+_DOTENV_LOADED = False
+
 class Settings(BaseSettings):
     """Application settings"""
     
@@ -11,33 +15,52 @@ class Settings(BaseSettings):
     model: str = "gpt-3.5-turbo"
     provider: str = "openai"  # openai, anthropic, or google
     log_level: Optional[str] = None
+    max_concurrency: int = Field(16, ge=1)  # Maximum in-flight model requests
+    max_requests_per_minute: int = 0  # Model requests started per minute (0 disables)
+    batch_max_tokens: int = 0  # Prompt tokens packed into one batch request (0 disables batching)
+    cache_dir: Optional[str] = None  # Directory for persisted summaries (None disables)
     
     model_config = SettingsConfigDict(
         env_file_encoding="utf-8",
         case_sensitive=False
     )
 
-@lru_cache
-def get_settings() -> Settings:
-    """Get cached settings instance."""
-    print("\n=== Debug: Loading Settings ===")
-    print(f"Current working directory: {os.getcwd()}")
-    
+# Directory of this module, used to look for .env files next to the package
+_SETTINGS_DIR = os.path.dirname(__file__)
+
+def _find_env_file() -> Optional[str]:
+    """Return the first existing .env file."""
     potential_env_paths = [
         os.path.join(os.getcwd(), '.env'),
-        os.path.join(os.path.dirname(__file__), '../../.env'),
-        os.path.join(os.path.dirname(__file__), '../.env'),
+        os.path.join(_SETTINGS_DIR, '../../.env'),
+        os.path.join(_SETTINGS_DIR, '../.env'),
     ]
     
     print("\nTrying possible .env paths:")
-    # Try each possible path
     for env_file in potential_env_paths:
+        exists = os.path.isfile(env_file)
         print(f"Checking: {env_file}")
-        print(f"File exists: {os.path.exists(env_file)}")
-        if os.path.exists(env_file):
-            load_dotenv(env_file, override=True)
-            print(f"Loaded .env from: {env_file}")
-            break
+        print(f"File exists: {exists}")
+        if exists:
+            return env_file
+    return None
+
+def _load_dotenv() -> None:
+    """Load the first .env file found into the environment."""
+    global _DOTENV_LOADED
+    if _DOTENV_LOADED:
+        return
+    _DOTENV_LOADED = True
+    
+    print("\n=== Debug: Loading Settings ===")
+    print(f"Current working directory: {os.getcwd()}")
+    
+    # Provider SDKs read API keys from os.environ, so the .env file is loaded
+    # into the environment rather than only into Settings
+    env_file = _find_env_file()
+    if env_file:
+        load_dotenv(env_file, override=True)
+        print(f"Loaded .env from: {env_file}")
     
     # Print environment variables (without sensitive data)
     print("\nEnvironment variables:")
@@ -46,5 +69,16 @@ def get_settings() -> Settings:
     print(f"LOG_LEVEL: {os.environ.get('LOG_LEVEL')}")
     print(f"OPENAI_API_KEY exists: {bool(os.environ.get('OPENAI_API_KEY'))}")
     print("=== End Debug ===\n")
-    
-    return Settings() 
\ No newline at end of file
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Get cached settings instance."""
+    _load_dotenv()
+    return Settings()
+
+def reload_settings() -> Settings:
+    """Reload .env files and settings, e.g. after changing the environment in tests."""
+    global _DOTENV_LOADED
+    _DOTENV_LOADED = False
+    get_settings.cache_clear()
+    return get_settings() 
\ No newline at end of file
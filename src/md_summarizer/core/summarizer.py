@@ -13,6 +13,7 @@ from ..agent import SummarizerAgent
 from ..parser import MarkdownParser
 from ..models import Section
 from ..progress.models import ProgressStatus, ProgressUpdate
+from ..config.settings import get_settings
 from ..common.signals import (
     section_complete, processing_complete,
 )
@@ -22,11 +23,23 @@ logger = logging.getLogger(__name__)
 class MarkdownSummarizer:
     """Summarizes markdown content by recursively processing sections."""
     
-    def __init__(self, agent: Optional[SummarizerAgent] = None):
+    def __init__(
+        self,
+        agent: Optional[SummarizerAgent] = None,
+        batch_max_tokens: Optional[int] = None
+    ):
         """Initialize summarizer with AI agent.
+        
+        Args:
+            agent: Agent used to summarize sections
+            batch_max_tokens: Token budget for packing sections into a single
+                request, defaults to the BATCH_MAX_TOKENS setting (0 disables)
         """
         self.agent = agent or SummarizerAgent()
         self.parser = MarkdownParser()
+        if batch_max_tokens is None:
+            batch_max_tokens = get_settings().batch_max_tokens
+        self.batch_max_tokens = batch_max_tokens
 
     def usage(self) -> Usage:
         """Return usage statistics."""
@@ -39,7 +52,7 @@ class MarkdownSummarizer:
                 if update.status == ProgressStatus.COMPLETE:
                     return update.content
         except Exception as e:
-            logger.exception(f"Error during summarization: {e}")
+            logger.exception("Error during summarization: %s", e)
             raise
 
     async def stream(self, content: str) -> AsyncGenerator[ProgressUpdate, None]:
@@ -65,10 +78,13 @@ class MarkdownSummarizer:
             
             # Connect to section completion signal
             with section_complete.connected_to(on_section_complete):
-                tasks = [
-                    section.process(self.agent)
-                    for section in sections.values()
-                ]
+                if self.batch_max_tokens:
+                    tasks = [self._process_batched(sections)]
+                else:
+                    tasks = [
+                        section.process(self.agent)
+                        for section in sections.values()
+                    ]
             
                 # Process sections and yield updates
                 async with asyncio.TaskGroup() as tg:
@@ -78,7 +94,7 @@ class MarkdownSummarizer:
                     for _ in range(total_items):
                         try:
                             update = await section_updates.get()
-                            logger.info(f"Section completed: {update.section_title}")
+                            logger.info("Section completed: %s", update.section_title)
                             yield update
                         except asyncio.CancelledError:
                             logger.info("Section processing cancelled")
@@ -94,7 +110,7 @@ class MarkdownSummarizer:
                     )
                     
         except Exception as e:
-            logger.exception(f"Error during summarization: {e}")
+            logger.exception("Error during summarization: %s", e)
             yield ProgressUpdate(
                 status=ProgressStatus.ERROR,
                 error=str(e)
@@ -119,11 +135,75 @@ class MarkdownSummarizer:
         processing_complete.send(self, content=final)
         return final
 
+    async def _process_batched(self, sections: Dict[str, Section]) -> None:
+        """Process sections in batches packed up to the token budget."""
+        flat = self._flatten_sections(sections)
+        # The budget also has to hold the batch instructions and each section's marker
+        budget = self.batch_max_tokens - self.agent.batch_prompt_tokens
+        marker_tokens = self.agent.section_marker_tokens
+        token_counts = [
+            self.agent.estimate_tokens(section.content) + marker_tokens for section in flat
+        ]
+        
+        # The estimate is an upper bound but far from tight, so it is only good
+        # enough when everything already fits in one batch. Otherwise pack by exact
+        # counts. Tokenizing large sections is CPU heavy, keep it off the event loop
+        if sum(token_counts) > budget:
+            exact_counts = await asyncio.gather(
+                *(self.agent.acount_tokens(section.content) for section in flat)
+            )
+            token_counts = [tokens + marker_tokens for tokens in exact_counts]
+        batches = self._make_batches(flat, token_counts, budget)
+        await asyncio.gather(*(self._process_batch(batch) for batch in batches))
+
+    async def _process_batch(self, batch: List[Section]) -> None:
+        """Summarize a batch of sections with a single agent request."""
+        contents = await self.agent.run_batch([section.content for section in batch])
+        for section, content in zip(batch, contents):
+            section.content = content
+            section_complete.send(section, section_title=section.title)
+
+    def _make_batches(
+        self,
+        sections: List[Section],
+        token_counts: List[int],
+        budget: int
+    ) -> List[List[Section]]:
+        """Pack sections into as few batches as fit the token budget.
+        
+        Uses first-fit decreasing: the largest sections are placed first,
+        each into the first batch with room left. A section larger than the
+        budget gets a batch of its own. Summaries are mapped back to their
+        sections, so order within a batch does not matter.
+        """
+        batches = []
+        batch_tokens = []
+        by_size = sorted(zip(sections, token_counts), key=lambda item: item[1], reverse=True)
+        for section, tokens in by_size:
+            for i, used in enumerate(batch_tokens):
+                if used + tokens <= budget:
+                    batches[i].append(section)
+                    batch_tokens[i] += tokens
+                    break
+            else:
+                batches.append([section])
+                batch_tokens.append(tokens)
+        return batches
+
+    def _flatten_sections(self, sections: Dict[str, Section]) -> List[Section]:
+        """Flatten the section tree in document order."""
+        flat = []
+        for section in sections.values():
+            flat.append(section)
+            flat.extend(self._flatten_sections(section.sections))
+        return flat
+
     def _count_total_sections(self, sections: Dict[str, Section]) -> int:
         """Count total sections using recursive sum."""
         count = sum(1 + self._count_total_sections(section.sections) 
                   for section in sections.values())
-        logger.debug(f"Counted {count} sections: {[s.title for s in sections.values()]}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Counted %d sections: %s", count, [s.title for s in sections.values()])
         return count
 
     @property
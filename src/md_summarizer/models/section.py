@@ -3,6 +3,20 @@ from ..agent import SummarizerAgent
 from ..common.signals import section_complete
 from dataclasses import dataclass, field
 import asyncio
+import string
+
+# Maps lowercase ASCII letters and digits to themselves and every other byte to '_'
+_KEY_TABLE = bytes(
+    c if chr(c) in string.ascii_lowercase + string.digits else ord('_')
+    for c in range(256)
+)
+
+def make_key(title: str) -> str:
+    """Create a safe section key from title."""
+    # Non-ASCII characters become '?' and are then mapped to '_' like other symbols
+    key = title.lower().encode('ascii', 'replace').translate(_KEY_TABLE).decode('ascii')
+    # Collapse runs of '_' and strip them from both ends
+    return '_'.join(filter(None, key.split('_')))
 
 @dataclass
 class Section:
@@ -11,22 +25,30 @@ class Section:
     content: str
     level: int
     sections: Dict[str, 'Section'] = field(default_factory=dict)
+    # Safe key derived from title when the section is created, so title must not
+    # change afterwards. Not part of equality or repr since it only mirrors title
+    key: str = field(init=False, compare=False, repr=False)
     
     # Section level constants
     ROOT_LEVEL = 1
     IMPORTANT_LEVEL = 2
     
+    def __post_init__(self):
+        self.key = make_key(self.title)
+    
     async def process(self, agent: SummarizerAgent) -> None:
-        """Process section content recursively."""
-        # Process subsections first
-        tasks = [
-            section.process(agent)
-            for section in self.sections.values()
-        ]
-        if tasks:
-            await asyncio.gather(*tasks)
+        """Process section content recursively.
         
-        # Then process this section
+        A section's summary does not depend on its subsections, so this
+        section and all subsections are summarized concurrently.
+        """
+        await asyncio.gather(
+            self._summarize(agent),
+            *(section.process(agent) for section in self.sections.values())
+        )
+        
+    async def _summarize(self, agent: SummarizerAgent) -> None:
+        """Summarize this section's own content."""
         self.content = await agent.run(self.content)
         section_complete.send(self, section_title=self.title)
         
@@ -34,21 +56,15 @@ class Section:
         """Combine this section with its children into markdown."""
         parts = []
         
-        def get_header(level: int, title: str) -> str:
-            """Generate header with proper level."""
-            return '#' * max(1, level) + ' ' + title
-        
-        # Add this section's header and content
-        header = get_header(self.level, self.title)
-        parts.append(header)
-        if self.content:
-            parts.append(self.content)
-        
-        # Add child sections
-        for section in self.sections.values():
-            # Recursively combine child sections
-            child_content = section.combine()
-            if child_content:
-                parts.append(child_content)
+        # Walk the tree depth-first with an explicit stack so every header and
+        # content block lands in a single list that is joined once
+        stack = [self]
+        while stack:
+            section = stack.pop()
+            parts.append('#' * max(1, section.level) + ' ' + section.title)
+            if section.content:
+                parts.append(section.content)
+            # Push children reversed so they are visited in document order
+            stack.extend(reversed(section.sections.values()))
         
-        return '\n\n'.join(filter(None, parts)) 
\ No newline at end of file
+        return '\n\n'.join(parts)
\ No newline at end of file
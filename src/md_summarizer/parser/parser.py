@@ -1,116 +1,92 @@
-from dataclasses import dataclass, field
-from typing import Dict, Optional, List
+from typing import Dict, List
 import re
 import logging
 from ..models import Section
 
+# Matches either a code fence or a heading line, including the preceding newline.
+# Starting with a literal '\n' lets the regex engine jump between line starts with a
+# fast character search instead of attempting a match at every position.
+# [^\S\n] is any whitespace except newline, so matches never span lines
+_FENCE_OR_HEADING_RE = re.compile(
+    r'\n[^\S\n]*(?:(?P<fence>```)|(?P<hashes>#{1,6})[^\S\n]+(?P<title>\S.*?)[^\S\n]*$)',
+    re.MULTILINE
+)
+
 class MarkdownParser:
     def __init__(self):
         """Initialize markdown parser."""
         self.logger = logging.getLogger(__name__)
         
-    def _find_headings(self, content: str, level: int) -> List[tuple[int, str]]:
-        """Find all headings at specified level, ignoring those in code blocks."""
-        headings = []
+    def _collect_headings(self, content: str) -> List[tuple[int, int, int, str]]:
+        """Find all headings as (start, end, level, title), ignoring those in code blocks.
+        
+        start and end are the offsets of the heading line in content.
+        """
         in_code_block = False
+        headings = []
         
-        for line_num, line in enumerate(content.splitlines()):
-            stripped = line.strip()
-            
-            if stripped.startswith('```'):
+        # Prefix a newline so the first line is matched too. In the prefixed text
+        # match.start() is the line's start offset in content and match.end() is
+        # one past the line's end offset.
+        for match in _FENCE_OR_HEADING_RE.finditer('\n' + content):
+            if match.group('fence'):
                 in_code_block = not in_code_block
-                continue
-                
-            if not in_code_block:
-                heading_match = re.match(f'^#{{{level}}}\\s+(.+)$', stripped)
-                if heading_match:
-                    headings.append((line_num, heading_match.group(1)))
+            elif not in_code_block:
+                headings.append((
+                    match.start(),
+                    match.end() - 1,
+                    len(match.group('hashes')),
+                    match.group('title')
+                ))
         
         return headings
 
-    def _split_content_at_lines(self, content: str, split_points: List[int]) -> List[str]:
-        """Split content at specified line numbers."""
-        lines = content.splitlines()
+    def _build_sections(
+        self,
+        content: str,
+        headings: List[tuple[int, int, int, str]],
+        min_level: int
+    ) -> List[Section]:
+        """Build the section tree from the flat heading list.
+        
+        Levels are normalized so the highest level heading becomes level 1.
+        Returns the top-level sections.
+        """
+        level_adjust = min_level - 1
         sections = []
+        stack = []
         
-        for i, start in enumerate(split_points):
-            end = split_points[i + 1] if i < len(split_points) - 1 else len(lines)
-            section_lines = lines[start:end]
-            # Remove the heading line
-            section_content = '\n'.join(section_lines[1:])
-            sections.append(section_content)
-            
-        return sections
-
-    def _split_at_level(self, content: str, level: int) -> List[Section]:
-        """Split content at specified heading level."""
-        headings = self._find_headings(content, level)
-        if not headings:
-            return []
-        
-        split_points = [pos for pos, _ in headings]
-        section_contents = self._split_content_at_lines(content, split_points)
-        
-        sections = []
-        for (_, title), content in zip(headings, section_contents):
-            # Find where child sections begin
-            child_matches = list(re.finditer(f'^#{{{level+1}}}\\s+', content, re.MULTILINE))
-            
-            if child_matches:
-                # Only keep content up to first child section
-                parent_content = content[:child_matches[0].start()].strip()
-            else:
-                parent_content = content.strip()
-            
+        for i, (_, heading_end, level, title) in enumerate(headings):
+            # Section content runs until the next heading of any level
+            end = headings[i + 1][0] if i < len(headings) - 1 else len(content)
             section = Section(
                 title=title,
-                content=parent_content,
-                level=level
+                content=content[heading_end:end].strip(),
+                level=level - level_adjust
             )
             
-            # Process subsections
-            if level < 6:
-                subsections = self._split_at_level(content, level + 1)
-                if subsections:
-                    section.sections = {
-                        self._make_key(s.title): s 
-                        for s in subsections
-                    }
-            
-            sections.append(section)
+            # Attach to the closest preceding heading with a lower level
+            while stack and stack[-1].level >= section.level:
+                stack.pop()
+            if stack:
+                stack[-1].sections[section.key] = section
+            else:
+                sections.append(section)
+            stack.append(section)
         
         return sections
     
-    def _make_key(self, title: str) -> str:
-        """Create a safe section key from title."""
-        key = title.lower()
-        key = re.sub(r'[^a-z0-9]+', '_', key)
-        key = re.sub(r'_+', '_', key)
-        return key.strip('_')
-        
     def parse(self, content: str) -> Dict[str, Section]:
         """Parse markdown content into hierarchical sections."""
         self.logger.info("Starting markdown parsing...")
         
-        if not content.strip():
+        # isspace() avoids copying the whole document just to test for blank input
+        if not content or content.isspace():
             return {}
             
-        # Find the highest level heading used (smallest number of #s)
-        # but ignore headings in code blocks
-        headings = []
-        in_code_block = False
-        
-        for line in content.splitlines():
-            stripped = line.strip()
-            
-            if stripped.startswith('```'):
-                in_code_block = not in_code_block
-                continue
-                
-            if not in_code_block:
-                heading_match = re.match(r'^(#{1,6})\s', stripped)
-                if heading_match:
-                    headings.append(heading_match.group(1))
+        # A document without a single '#' cannot contain a heading, so skip
+        # the regex scan entirely for plain-text input
+        headings = self._collect_headings(content) if '#' in content else []
         
         if not headings:
             self.logger.info("No headings found, creating root section")
@@ -122,38 +98,11 @@ class MarkdownParser:
                 )
             }
             
-        min_level = min(len(h) for h in headings)
-        self.logger.info(f"Found minimum heading level: {min_level}")
-        
-        # Split at the highest level found and normalize levels
-        sections = self._split_at_level(content, min_level)
+        # Find the highest level heading used (smallest number of #s)
+        min_level = min(level for _, _, level, _ in headings)
+        self.logger.info("Found minimum heading level: %d", min_level)
         
-        # Normalize all levels by subtracting (min_level - 1)
-        def normalize_levels(section: Section, level_adjust: int):
-            section.level -= level_adjust
-            for subsection in section.sections.values():
-                normalize_levels(subsection, level_adjust)
-        
-        # Adjust all levels so minimum becomes level 1
-        level_adjust = min_level - 1
-        for section in sections:
-            normalize_levels(section, level_adjust)
+        sections = self._build_sections(content, headings, min_level)
         
         # Convert to dictionary
-        return {
-            self._make_key(section.title): section
-            for section in sections
-        }
-
-    def _create_section(self, match: re.Match) -> Section:
-        """Create section from regex match."""
-        level = len(match.group(1))  # Count #'s
-        title = match.group(2).strip()
-        content = match.group(3).strip() if match.group(3) else ""
-        
-        return Section(
-            title=title,
-            content=content,
-            level=level,  # Level is already correct from markdown
-            sections={}
-        )
\ No newline at end of file
+        return {section.key: section for section in sections}
@@ -1,8 +1,42 @@
 import pytest
 import os
+from pathlib import Path
 from md_summarizer import MarkdownSummarizer, MarkdownParser
 from md_summarizer.agent import SummarizerAgent
+from md_summarizer.config import get_settings
 import logging
+from pydantic_ai.usage import Usage
+
+from .utils import output_formatter
+
+FIXTURES_DIR = Path(__file__).parent / 'fixtures'
+
+def pytest_configure(config):
+    """Only print formatted test output when running verbosely, as make test does."""
+    output_formatter.enabled = config.getoption("verbose") > 0
+
+class FakeAgent:
+    """Stand-in for SummarizerAgent that echoes content back without calling a model."""
+    
+    def __init__(self):
+        self.usage = Usage()
+        self.system_prompt = "fake"
+        self.batch_prompt_tokens = 0
+        self.section_marker_tokens = 0
+        self.batches = []  # Contents of every run_batch call, for assertions
+    
+    async def run(self, content: str) -> str:
+        return content
+    
+    async def run_batch(self, contents: list[str]) -> list[str]:
+        self.batches.append(contents)
+        return list(contents)
+    
+    def estimate_tokens(self, text: str) -> int:
+        return len(text.split())
+    
+    async def acount_tokens(self, text: str) -> int:
+        return len(text.split())
 
 @pytest.fixture(scope="session", autouse=True)
 def setup_test_environment():
@@ -19,14 +53,88 @@ def setup_test_environment():
     
     # Now import settings
     from md_summarizer.config.settings import get_settings
+    from pydantic import ValidationError
+    
+    def load_settings():
+        # Without an API key only the offline tests can run, see require_api_key.
+        # Any other invalid setting should still fail the session
+        try:
+            return get_settings()
+        except ValidationError as e:
+            if any(error["loc"] != ("openai_api_key",) for error in e.errors()):
+                raise
+            return None
     
-    yield get_settings()
+    # The first load also reads .env into the environment
+    load_settings()
+    
+    # Live tests assert on the tokens each run actually sends, so summaries must
+    # not come from the on-disk cache or be packed into batches
+    with pytest.MonkeyPatch.context() as mp:
+        mp.delenv("CACHE_DIR", raising=False)
+        mp.delenv("BATCH_MAX_TOKENS", raising=False)
+        get_settings.cache_clear()
+        yield load_settings()
+    get_settings.cache_clear()
+
+@pytest.fixture(autouse=True)
+def require_api_key(request, setup_test_environment):
+    """Skip tests that call the model API when no OPENAI_API_KEY is configured."""
+    if "no_api_key_ok" not in request.keywords and not os.getenv("OPENAI_API_KEY"):
+        pytest.skip("OPENAI_API_KEY is not set")
 
 @pytest.fixture
+def offline_env(monkeypatch):
+    """Allow building real SummarizerAgents without OPENAI_API_KEY.
+    
+    For tests that swap the agent's model for pydantic-ai's TestModel. The model
+    client is created with the agent and needs some key, even one never used.
+    """
+    missing_key = not os.getenv("OPENAI_API_KEY")
+    if missing_key:
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        get_settings.cache_clear()
+    yield
+    if missing_key:
+        get_settings.cache_clear()
+
+@pytest.fixture
+def offline_agent(offline_env):
+    """Create a SummarizerAgent for use with TestModel overrides."""
+    return SummarizerAgent()
+
+@pytest.fixture(scope="module")
+def vcr_config():
+    """Record API calls to cassettes so later runs replay them instead of hitting the network."""
+    return {
+        "filter_headers": ["authorization", "api-key", "x-api-key"],
+        # Sections are summarized concurrently against the same endpoint, so
+        # requests can only be told apart by their body
+        "match_on": ["method", "uri", "body"],
+        # tiktoken downloads its encodings from here and caches them on disk itself
+        "ignore_hosts": ["openaipublic.blob.core.windows.net"],
+    }
+
+@pytest.fixture(scope="session")
 def parser():
-    """Create a parser with default settings."""
+    """Create a parser with default settings, shared since parsing holds no state."""
     return MarkdownParser()
 
+@pytest.fixture(scope="session")
+def example_doc_content():
+    """Read the example document once per session."""
+    return Path('tests/example_doc.md').read_text(encoding='utf-8')
+
+@pytest.fixture(scope="session")
+def async_callback_content():
+    """Read the async callbacks documentation section once per session."""
+    return (FIXTURES_DIR / 'async_callback.md').read_text(encoding='utf-8')
+
+@pytest.fixture(scope="session")
+def node_gyp_content():
+    """Read the node-gyp README once per session."""
+    return (FIXTURES_DIR / 'node_gyp.md').read_text(encoding='utf-8')
+
 @pytest.fixture
 async def agent():
     """Create Agent for testing."""
@@ -46,11 +154,22 @@ def summarizer(setup_test_environment):
     
     return MarkdownSummarizer(agent=SummarizerAgent())
 
-@pytest.fixture(autouse=True)
+@pytest.fixture
+def fake_agent():
+    """Create a fresh stub agent whose calls can be inspected."""
+    return FakeAgent()
+
+@pytest.fixture(scope="session")
+def stub_summarizer():
+    """Create a summarizer that never calls the API, for structural tests."""
+    return MarkdownSummarizer(agent=FakeAgent(), batch_max_tokens=0)
+
+@pytest.fixture(scope="session", autouse=True)
 def setup_logging(setup_test_environment):
-    """Configure logging for tests."""
-    # Get log level from settings
-    log_level = getattr(logging, setup_test_environment.log_level.upper())
+    """Configure logging once for the test session."""
+    # Get log level from settings, if they could be loaded
+    level_name = setup_test_environment and setup_test_environment.log_level
+    log_level = getattr(logging, (level_name or "INFO").upper())
     
     formatter = logging.Formatter('%(message)s')
     
@@ -62,10 +181,7 @@ def setup_logging(setup_test_environment):
     logging.getLogger("httpx").setLevel(logging.WARNING)
     logging.getLogger("httpcore").setLevel(logging.WARNING)
     
-    # Remove any existing handlers
-    root_logger.handlers = []
-    
-    # Add our clean formatter
+    # Add our clean formatter alongside pytest's own capture handlers
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
     root_logger.addHandler(console_handler) 
\ No newline at end of file
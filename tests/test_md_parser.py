@@ -0,0 +1,72 @@
+import pytest
+
+# The parser never calls the model API
+pytestmark = pytest.mark.no_api_key_ok
+
+def outline(sections):
+    """Reduce parsed sections to nested (title, content, level, children) tuples."""
+    return [
+        (section.title, section.content, section.level, outline(section.sections))
+        for section in sections.values()
+    ]
+
+CASES = [
+    (
+        "basic",
+        "# First\nContent 1\n# Second\nContent 2",
+        [
+            ("First", "Content 1", 1, []),
+            ("Second", "Content 2", 1, []),
+        ],
+    ),
+    (
+        "nested",
+        "# Top\nIntro\n## Child\nChild text\n### Grandchild\nDeep\n## Sibling\nMore",
+        [
+            ("Top", "Intro", 1, [
+                ("Child", "Child text", 2, [
+                    ("Grandchild", "Deep", 3, []),
+                ]),
+                ("Sibling", "More", 2, []),
+            ]),
+        ],
+    ),
+    (
+        "normalized_levels",
+        "## Usage\nText\n### Options\nFlags",
+        [
+            ("Usage", "Text", 1, [
+                ("Options", "Flags", 2, []),
+            ]),
+        ],
+    ),
+    (
+        "code_block",
+        "# Example\n```python\n# not a heading\nprint('hi')\n```\n# Next\nDone",
+        [
+            ("Example", "```python\n# not a heading\nprint('hi')\n```", 1, []),
+            ("Next", "Done", 1, []),
+        ],
+    ),
+    (
+        "blank_heading",
+        "# First\nContent 1\n#   \nMore",
+        [
+            ("First", "Content 1\n#   \nMore", 1, []),
+        ],
+    ),
+    (
+        "no_headings",
+        "Just some text\nover two lines",
+        [
+            ("root", "Just some text\nover two lines", 1, []),
+        ],
+    ),
+    ("empty", "", []),
+    ("whitespace", "   \n\n   \n", []),
+]
+
+@pytest.mark.parametrize("name,markdown,expected", CASES, ids=[case[0] for case in CASES])
+def test_parse_cases(parser, name, markdown, expected):
+    """Test that markdown parses into the expected section tree."""
+    assert outline(parser.parse(markdown)) == expected
@@ -0,0 +1,226 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from pydantic_ai import capture_run_messages
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import FunctionModel
+from pydantic_ai.models.test import TestModel
+from pydantic_ai.usage import Usage
+from md_summarizer.agent import SummarizerAgent
+from md_summarizer.config.settings import get_settings
+
+# Model calls go to pydantic-ai's TestModel, never the API
+pytestmark = pytest.mark.no_api_key_ok
+
+def summary_response(info, content="summary"):
+    """Build the model response a FunctionModel returns for a single-section summary."""
+    return ModelResponse(parts=[ToolCallPart.from_raw_args(info.result_tools[0].name, {"content": content})])
+
+@pytest.mark.asyncio
+async def test_disk_cache_round_trip(offline_env, tmp_path):
+    """Test that a summary written to the disk cache is reused by a new agent."""
+    content = "Some section content"
+    
+    writer = SummarizerAgent(cache_dir=str(tmp_path))
+    with writer.agent.override(model=TestModel(custom_result_args={"content": "cached summary"})):
+        assert await writer.run(content) == "cached summary"
+    assert len(list(tmp_path.iterdir())) == 1
+    
+    # A fresh agent has an empty memory cache, so this can only come from disk
+    reader = SummarizerAgent(cache_dir=str(tmp_path))
+    with reader.agent.override(model=TestModel(custom_result_args={"content": "new summary"})):
+        assert await reader.run(content) == "cached summary"
+    assert reader.usage.requests == 0
+
+def test_disk_cache_write_leaves_no_partial_file(offline_env, tmp_path, monkeypatch):
+    """Test that a failed cache write leaves neither a summary nor a temporary file behind."""
+    agent = SummarizerAgent(cache_dir=str(tmp_path))
+    
+    def fail_replace(src, dst):
+        raise OSError("disk full")
+    
+    monkeypatch.setattr("md_summarizer.agent.summarizer_agent.os.replace", fail_replace)
+    with pytest.raises(OSError):
+        agent._set_cached(agent._cache_key("content"), "summary")
+    assert not list(tmp_path.iterdir())
+
+@pytest.mark.asyncio
+async def test_run_batch(offline_agent):
+    """Test that uncached sections share one request and cached ones are reused."""
+    agent = offline_agent
+    with agent.agent.override(model=TestModel(custom_result_args={"content": "cached"})):
+        await agent.run("first")
+    
+    batch_model = TestModel(custom_result_args={"contents": ["second summary", "third summary"]})
+    with capture_run_messages() as messages:
+        with agent.batch_agent.override(model=batch_model):
+            results = await agent.run_batch(["first", "second", "third", "  "])
+    
+    assert results == ["cached", "second summary", "third summary", "  "]
+    assert agent.usage.requests == 2
+    
+    # Only the two uncached sections are sent, each behind its marker
+    prompt = messages[0].parts[-1].content
+    assert "=== SECTION 1 ===\nsecond" in prompt
+    assert "=== SECTION 2 ===\nthird" in prompt
+    assert "=== SECTION 3 ===" not in prompt
+    
+    # Batch summaries are cached per section
+    assert await agent.run("third") == "third summary"
+    assert agent.usage.requests == 2
+
+@pytest.mark.asyncio
+async def test_run_batch_sends_duplicates_once(offline_agent):
+    """Test that identical sections in one batch are sent once and share the summary."""
+    agent = offline_agent
+    batch_model = TestModel(custom_result_args={"contents": ["same summary", "other summary"]})
+    with capture_run_messages() as messages:
+        with agent.batch_agent.override(model=batch_model):
+            results = await agent.run_batch(["same", "other", "same"])
+    
+    assert results == ["same summary", "other summary", "same summary"]
+    assert "=== SECTION 3 ===" not in messages[0].parts[-1].content
+
+@pytest.mark.asyncio
+async def test_run_batch_usage_excludes_batch_overhead(offline_agent, monkeypatch):
+    """Test that batch instructions and section markers are not counted as section tokens."""
+    agent = offline_agent
+    
+    async def run(user_prompt):
+        return SimpleNamespace(
+            data=SimpleNamespace(contents=["first summary", "second summary"]),
+            usage=lambda: Usage(request_tokens=1000, response_tokens=10, total_tokens=1010),
+        )
+    monkeypatch.setattr(agent.batch_agent, "run", run)
+    
+    await agent.run_batch(["first", "second"])
+    
+    overhead = (
+        agent.system_prompt_tokens
+        + agent.document_prompt_tokens
+        + agent.batch_prompt_tokens
+        + 2 * agent.section_marker_tokens
+    )
+    assert agent.usage.request_tokens == 1000 - overhead
+
+@pytest.mark.asyncio
+async def test_run_batch_falls_back_on_count_mismatch(offline_agent):
+    """Test that a batch reply with the wrong number of summaries is retried per section."""
+    agent = offline_agent
+    batch_model = TestModel(custom_result_args={"contents": ["only one"]})
+    single_model = TestModel(custom_result_args={"content": "single"})
+    with agent.batch_agent.override(model=batch_model), agent.agent.override(model=single_model):
+        results = await agent.run_batch(["first", "second", "third"])
+    
+    assert results == ["single", "single", "single"]
+    # One batch request, then one request per section
+    assert agent.usage.requests == 4
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates_share_one_request(offline_agent):
+    """Test that identical content requested concurrently is only sent to the model once."""
+    agent = offline_agent
+    with agent.agent.override(model=TestModel(custom_result_args={"content": "summary"})):
+        results = await asyncio.gather(agent.run("same content"), agent.run("same content"))
+    
+    assert results == ["summary", "summary"]
+    assert agent.usage.requests == 1
+
+@pytest.mark.asyncio
+async def test_request_cancelled_with_last_caller(offline_agent):
+    """Test that a shared request is cancelled once no caller is waiting for it."""
+    agent = offline_agent
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+    
+    async def slow_model(messages, info):
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+    
+    with agent.agent.override(model=FunctionModel(slow_model)):
+        caller = asyncio.create_task(agent.run("slow content"))
+        await started.wait()
+        (request,) = agent._in_flight.values()
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        with pytest.raises(asyncio.CancelledError):
+            await request.task
+    
+    assert cancelled.is_set()
+    
+    # Let the request's done-callback run
+    await asyncio.sleep(0)
+    assert not agent._in_flight
+
+@pytest.mark.asyncio
+async def test_run_after_cancel_starts_fresh_request(offline_agent):
+    """Test that a new caller does not join a request cancelled with its last caller."""
+    agent = offline_agent
+    started = asyncio.Event()
+    
+    async def slow_model(messages, info):
+        started.set()
+        await asyncio.sleep(60)
+    
+    with agent.agent.override(model=FunctionModel(slow_model)):
+        caller = asyncio.create_task(agent.run("same content"))
+        await started.wait()
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+    
+    with agent.agent.override(model=TestModel(custom_result_args={"content": "summary"})):
+        assert await agent.run("same content") == "summary"
+
+@pytest.mark.asyncio
+async def test_max_requests_per_minute_spaces_requests(offline_env, monkeypatch):
+    """Test that request starts are spaced out to stay under max_requests_per_minute."""
+    monkeypatch.setenv("MAX_REQUESTS_PER_MINUTE", "600")
+    get_settings.cache_clear()
+    agent = SummarizerAgent()
+    # Don't leak the limit into later tests once the environment is restored
+    get_settings.cache_clear()
+    
+    loop = asyncio.get_running_loop()
+    starts = []
+    
+    async def timed_model(messages, info):
+        starts.append(loop.time())
+        return summary_response(info)
+    
+    with agent.agent.override(model=FunctionModel(timed_model)):
+        await asyncio.gather(*(agent.run(f"content {i}") for i in range(3)))
+    
+    # 600 requests per minute is one every 0.1s, allowing for timer granularity
+    starts.sort()
+    assert all(later - earlier >= 0.09 for earlier, later in zip(starts, starts[1:]))
+
+@pytest.mark.asyncio
+async def test_max_concurrency_caps_in_flight_requests(offline_env):
+    """Test that no more than max_concurrency model requests run at once."""
+    agent = SummarizerAgent(max_concurrency=2)
+    in_flight = 0
+    peak = 0
+    
+    async def counting_model(messages, info):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return summary_response(info)
+    
+    with agent.agent.override(model=FunctionModel(counting_model)):
+        await asyncio.gather(*(agent.run(f"content {i}") for i in range(5)))
+    
+    assert peak == 2
+
+def test_max_concurrency_must_be_positive(offline_env):
+    """Test that a concurrency limit below one is rejected."""
+    with pytest.raises(ValueError):
+        SummarizerAgent(max_concurrency=0)
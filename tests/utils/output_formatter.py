@@ -2,27 +2,41 @@
 from md_summarizer.agent import SummarizerAgent
 
 star_count = 30
+_STAR_BAR = "⭐️"*star_count
+
+# Printing is skipped unless pytest runs verbosely, see pytest_configure in conftest.py
+enabled = True
 
 def format_section(title: str, content: str) -> None:
     """Format a section of output with automatically generated stats."""
-    # Section header
-    
-    print("\n" + "⭐️"*star_count)
-    print(f"⭐️ {title}")
-    print("⭐️"*star_count + "\n")
+    if not enabled:
+        return
     
-    # Content
-    print(f"{content}\n")
+    # Build the whole section and print it once
+    print("\n".join([
+        "",
+        _STAR_BAR,
+        f"⭐️ {title}",
+        _STAR_BAR,
+        "",
+        f"{content}\n",
+    ]))
     
 def format_comparison(input_text: str, output_text: str, agent: SummarizerAgent) -> None:
     """Format input/output comparison with auto-generated stats."""
+    if not enabled:
+        return
     # Show reductions
     input_tokens = agent.usage.request_tokens
     output_tokens = agent.usage.response_tokens
 
-    print("\n" + "⭐️"*star_count)
-    print("\nReductions:")
-    print("-"*20)
-    print(f"{'Input Tokens':<20}: {input_tokens}")
-    print(f"{'Output Tokens':<20}: {output_tokens}")
-    print(f"{'Tokens Reduction':<20}: {(1 - output_tokens/input_tokens):.1%}")
\ No newline at end of file
+    print("\n".join([
+        "",
+        _STAR_BAR,
+        "",
+        "Reductions:",
+        "-"*20,
+        f"{'Input Tokens':<20}: {input_tokens}",
+        f"{'Output Tokens':<20}: {output_tokens}",
+        f"{'Tokens Reduction':<20}: {(1 - output_tokens/input_tokens):.1%}",
+    ]))